@@ -16,7 +16,7 @@ from src.metrics import LT_dendrogram_purity
 from src.monitors import MonitorTree
 from src.optimization import train_stochastic, evaluate
 from src.datasets import Dataset, TorchDataset
-from src.utils import deterministic 
+from src.utils import check_num_workers, compile_model, deterministic, get_device 
 
 DATA_NAME = sys.argv[1]
 TREE_DEPTH = int(sys.argv[2])
@@ -24,6 +24,8 @@ REG = float(sys.argv[3])
 
 LR = 0.001
 EPOCHS = 100
+NUM_WORKERS = check_num_workers(16)
+LOG_EVERY = 10 # per-iteration scalars and tree statistics are logged every LOG_EVERY iterations
 
 # selecting input and output features for self-supervised training
 if DATA_NAME == "COVTYPE":
@@ -40,23 +42,26 @@ elif DATA_NAME == "GLASS":
     
 pruning = REG > 0
 
-data = Dataset(DATA_NAME, normalize=True, in_features=in_features, out_features=out_features, seed=459107)
+pin_memory, device = get_device()
+
+data = Dataset(DATA_NAME, normalize=True, in_features=in_features, out_features=out_features, seed=459107, cache=True)
 classes = np.unique(data.y_train)
 num_classes = max(classes) + 1
 
-trainloader = DataLoader(TorchDataset(data.X_train_in, data.X_train_out), batch_size=BATCH_SIZE, shuffle=True, num_workers=16)
-valloader = DataLoader(TorchDataset(data.X_valid_in, data.X_valid_out), batch_size=BATCH_SIZE*2, shuffle=False, num_workers=16)
-testloader = DataLoader(TorchDataset(data.X_test_in, data.X_test_out), batch_size=BATCH_SIZE*2, shuffle=False, num_workers=16)
+trainloader = DataLoader(TorchDataset(data.X_train_in, data.X_train_out), batch_size=BATCH_SIZE, shuffle=True, num_workers=NUM_WORKERS, pin_memory=pin_memory, persistent_workers=NUM_WORKERS > 0, prefetch_factor=4)
+valloader = DataLoader(TorchDataset(data.X_valid_in, data.X_valid_out), batch_size=BATCH_SIZE*2, shuffle=False, num_workers=NUM_WORKERS, pin_memory=pin_memory, persistent_workers=NUM_WORKERS > 0, prefetch_factor=4)
+testloader = DataLoader(TorchDataset(data.X_test_in, data.X_test_out), batch_size=BATCH_SIZE*2, shuffle=False, num_workers=NUM_WORKERS, pin_memory=pin_memory, persistent_workers=NUM_WORKERS > 0, prefetch_factor=4)
 
 test_scores= []
 for SEED in [1225, 1337, 2020, 6021991]:
 
-    deterministic(SEED)
+    deterministic(SEED, cudnn_benchmark=True)
 
     save_dir = Path("./results/clustering-selfsup/") / DATA_NAME / f"out-feats={out_features}/depth={TREE_DEPTH}/reg={REG}/seed={SEED}"
     save_dir.mkdir(parents=True, exist_ok=True)
 
-    model = LTRegressor(TREE_DEPTH, data.X_train_in.shape[1:], data.X_train_out.shape[1:], reg=REG, split_func=SPLIT)
+    model = LTRegressor(TREE_DEPTH, data.X_train_in.shape[1:], data.X_train_out.shape[1:], reg=REG, split_func=SPLIT).to(device)
+    model = compile_model(model, device)
 
     print(model.count_parameters(), "model's parameters")
     # init optimizer
@@ -69,7 +74,7 @@ for SEED in [1225, 1337, 2020, 6021991]:
     criterion = MSELoss(reduction="sum")
 
     # init train-eval monitoring 
-    monitor = MonitorTree(pruning, save_dir)
+    monitor = MonitorTree(pruning, save_dir, log_every=LOG_EVERY)
 
     state = {
         'batch-size': BATCH_SIZE,
@@ -87,9 +92,9 @@ for SEED in [1225, 1337, 2020, 6021991]:
     best_e = -1
     no_improv = 0
     for e in range(EPOCHS):
-        train_stochastic(trainloader, model, optimizer, criterion, epoch=e, monitor=monitor)
+        train_stochastic(trainloader, model, optimizer, criterion, epoch=e, monitor=monitor, device=device, amp=True, log_every=LOG_EVERY)
 
-        val_loss = evaluate(valloader, model, {'MSE': criterion}, epoch=e, monitor=monitor)
+        val_loss = evaluate(valloader, model, {'MSE': criterion}, epoch=e, monitor=monitor, device=device)
 
         print("Epoch %i: validation mse = %f\n" % (e, val_loss['MSE']))
 
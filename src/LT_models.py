@@ -51,7 +51,7 @@ class LatentTree(torch.nn.Module):
 
     def predict(self, x):
 
-        z = self.forward(x).detach().numpy()
+        z = self.forward(x).detach().cpu().numpy()
 
         return z, self.bst.predict(z)
 
@@ -76,7 +76,9 @@ class LatentTree(torch.nn.Module):
 
     def _init_bias(self, x):
 
-        s = self.split(x)
+        # bias is initialized (and kept as a parameter) in float32, even when the first forward runs under autocast
+        with torch.autocast(x.device.type, enabled=False):
+            s = self.split(x.float())
         bias = -s.mean(0)
 
         node_masks = [np.array([True] * len(x))] # set of points assigned to each node
@@ -125,13 +127,15 @@ class LTModel(torch.nn.Module):
             self.comp = concat_func
             self.pred_in_size = np.prod(in_size) + self.latent_tree.bst.nb_nodes # predictor's input size
 
-    def train(self):
-        self.latent_tree.train()
-        self.predictor.train()
+    def train(self, mode=True):
+        self.training = mode
+        self.latent_tree.train(mode)
+        self.predictor.train(mode)
+
+        return self
 
     def eval(self):
-        self.latent_tree.eval()
-        self.predictor.eval() 
+        return self.train(False)
 
     def freeze(self, which='predictor'):
 
@@ -220,7 +224,8 @@ class LTModel(torch.nn.Module):
             state_dict = self.module.state_dict()
 
         except AttributeError:
-            state_dict = self.state_dict()
+            # unwrap models compiled with torch.compile
+            state_dict = getattr(self, '_orig_mod', self).state_dict()
 
         state['model_state_dict'] = state_dict
         state['optimizer_state_dict'] = optimizer.state_dict()
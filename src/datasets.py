@@ -1,3 +1,7 @@
+import hashlib
+import shutil
+import tempfile
+
 from pathlib import Path
 
 from sklearn.preprocessing import QuantileTransformer
@@ -23,6 +27,10 @@ REAL_DATASETS = {
     'TTT': fetch_TICTACTOE,
 }
 
+# arrays stored in the preprocessed dataset cache
+SPLITS = ['X_train', 'y_train', 'X_valid', 'y_valid', 'X_test', 'y_test']
+STATISTICS = ['mean', 'std', 'mean_y', 'std_y']
+
 TOY_DATASETS = [
     'xor',
     'reg-xor',
@@ -35,7 +43,7 @@ class Dataset:
     Code adapted from https://github.com/Qwicen/node/blob/master/lib/data.py .
 
     """
-    def __init__(self, dataset, data_path='./DATA', normalize=False, normalize_target=False, quantile_transform=False, quantile_noise=1e-3, in_features=None, out_features=None, flatten=False, **kwargs):
+    def __init__(self, dataset, data_path='./DATA', normalize=False, normalize_target=False, quantile_transform=False, quantile_noise=1e-3, in_features=None, out_features=None, flatten=False, cache=False, **kwargs):
         """
         Dataset is a dataclass that contains all training and evaluation data required for an experiment
         :param dataset: a pre-defined dataset name (see DATASETS) or a custom dataset
@@ -47,62 +55,95 @@ class Dataset:
         :param in_features: which features to use as inputs
         :param out_features: which features to reconstruct as output
         :param flatten: whether flattening instances to vectors
+        :param cache: whether storing the preprocessed dataset into {data_path}/{dataset}/cache, to be memory-mapped by later runs with the same preprocessing
         :param kwargs: depending on the dataset, you may select train size, test size or other params
         """
 
         if dataset in REAL_DATASETS:
-            data_dict = REAL_DATASETS[dataset](Path(data_path) / dataset, **kwargs)
-
-            self.X_train = data_dict['X_train']
-            self.y_train = data_dict['y_train']
-            self.X_valid = data_dict['X_valid']
-            self.y_valid = data_dict['y_valid']
-            self.X_test = data_dict['X_test']
-            self.y_test = data_dict['y_test']
-
-            if flatten:
-                self.X_train, self.X_valid, self.X_test = self.X_train.reshape(len(self.X_train), -1), self.X_valid.reshape(len(self.X_valid), -1), self.X_test.reshape(len(self.X_test), -1)
-
-            if normalize:
-
-                print("Normalize dataset")
-                axis = [0] + [i + 2 for i in range(self.X_train.ndim - 2)]
-                self.mean = np.mean(self.X_train, axis=tuple(axis), dtype=np.float32)
-                self.std = np.std(self.X_train, axis=tuple(axis), dtype=np.float32)
-
-                # if constants, set std to 1
-                self.std[self.std == 0.] = 1.
-
-                if dataset not in ['ALOI']:
-                    self.X_train = (self.X_train - self.mean) / self.std
-                    self.X_valid = (self.X_valid - self.mean) / self.std
-                    self.X_test = (self.X_test - self.mean) / self.std
+            cache_dir = None
+            if cache:
+                key = repr((dataset, normalize, normalize_target, quantile_transform, quantile_noise, flatten, sorted(kwargs.items())))
+                cache_dir = Path(data_path) / dataset / 'cache' / hashlib.md5(key.encode()).hexdigest()
 
-            if quantile_transform:
-                quantile_train = np.copy(self.X_train)
-                if quantile_noise:
-                    stds = np.std(quantile_train, axis=0, keepdims=True)
-                    noise_std = quantile_noise / np.maximum(stds, quantile_noise)
-                    quantile_train += noise_std * np.random.randn(*quantile_train.shape)
+            if cache_dir is not None and cache_dir.exists():
 
-                qt = QuantileTransformer(output_distribution='normal').fit(quantile_train)
-                self.X_train = qt.transform(self.X_train)
-                self.X_valid = qt.transform(self.X_valid)
-                self.X_test = qt.transform(self.X_test)
+                print("Load preprocessed dataset from", cache_dir)
+                # memory-mapped copy-on-write arrays: no copy at loading, pages shared with DataLoader workers
+                for f in cache_dir.glob('*.npy'):
+                    setattr(self, f.stem, np.load(f, mmap_mode='c' if f.stem in SPLITS else None))
 
-            if normalize_target:
-
-                print("Normalize target value")
-                self.mean_y = np.mean(self.y_train, axis=0, dtype=np.float32)
-                self.std_y = np.std(self.y_train, axis=0, dtype=np.float32)
-
-                # if constants, set std to 1
-                if self.std_y == 0.:
-                    self.std_y = 1.
-
-                self.y_train = (self.y_train - self.mean_y) / self.std_y
-                self.y_valid = (self.y_valid - self.mean_y) / self.std_y
-                self.y_test = (self.y_test - self.mean_y) / self.std_y
+            else:
+                data_dict = REAL_DATASETS[dataset](Path(data_path) / dataset, **kwargs)
+
+                self.X_train = data_dict['X_train']
+                self.y_train = data_dict['y_train']
+                self.X_valid = data_dict['X_valid']
+                self.y_valid = data_dict['y_valid']
+                self.X_test = data_dict['X_test']
+                self.y_test = data_dict['y_test']
+
+                if flatten:
+                    self.X_train, self.X_valid, self.X_test = self.X_train.reshape(len(self.X_train), -1), self.X_valid.reshape(len(self.X_valid), -1), self.X_test.reshape(len(self.X_test), -1)
+
+                if normalize:
+
+                    print("Normalize dataset")
+                    axis = [0] + [i + 2 for i in range(self.X_train.ndim - 2)]
+                    self.mean = np.mean(self.X_train, axis=tuple(axis), dtype=np.float32)
+                    self.std = np.std(self.X_train, axis=tuple(axis), dtype=np.float32)
+
+                    # if constants, set std to 1
+                    self.std[self.std == 0.] = 1.
+
+                    if dataset not in ['ALOI']:
+                        self.X_train = (self.X_train - self.mean) / self.std
+                        self.X_valid = (self.X_valid - self.mean) / self.std
+                        self.X_test = (self.X_test - self.mean) / self.std
+
+                if quantile_transform:
+                    quantile_train = np.copy(self.X_train)
+                    if quantile_noise:
+                        stds = np.std(quantile_train, axis=0, keepdims=True)
+                        noise_std = quantile_noise / np.maximum(stds, quantile_noise)
+                        quantile_train += noise_std * np.random.randn(*quantile_train.shape)
+
+                    qt = QuantileTransformer(output_distribution='normal').fit(quantile_train)
+                    self.X_train = qt.transform(self.X_train)
+                    self.X_valid = qt.transform(self.X_valid)
+                    self.X_test = qt.transform(self.X_test)
+
+                if normalize_target:
+
+                    print("Normalize target value")
+                    self.mean_y = np.mean(self.y_train, axis=0, dtype=np.float32)
+                    self.std_y = np.std(self.y_train, axis=0, dtype=np.float32)
+
+                    # if constants, set std to 1
+                    if self.std_y == 0.:
+                        self.std_y = 1.
+
+                    self.y_train = (self.y_train - self.mean_y) / self.std_y
+                    self.y_valid = (self.y_valid - self.mean_y) / self.std_y
+                    self.y_test = (self.y_test - self.mean_y) / self.std_y
+
+                if cache_dir is not None:
+
+                    print("Save preprocessed dataset into", cache_dir)
+                    # written in a private directory and published by an atomic rename, concurrent runs never see partial files
+                    cache_dir.parent.mkdir(parents=True, exist_ok=True)
+                    tmp_dir = Path(tempfile.mkdtemp(dir=cache_dir.parent))
+
+                    for name in SPLITS + STATISTICS:
+                        if hasattr(self, name):
+                            np.save(tmp_dir / f'{name}.npy', getattr(self, name))
+
+                    try:
+                        tmp_dir.rename(cache_dir)
+                    except OSError:
+                        # another run published the same cache meanwhile
+                        shutil.rmtree(tmp_dir)
+                        if not cache_dir.exists():
+                            raise
 
             if in_features is not None:
                 self.X_train_in, self.X_valid_in, self.X_test_in = self.X_train[:, in_features], self.X_valid[:, in_features], self.X_test[:, in_features]
@@ -121,7 +162,17 @@ class Dataset:
         self.data_path = data_path
         self.dataset = dataset
 
+def as_tensor(data):
+    """ contiguous tensor sharing memory with <data> when possible, floating data is cast to float32 """
+    data = torch.as_tensor(np.ascontiguousarray(data))
+
+    if data.is_floating_point():
+        data = data.float()
+
+    return data
+
 class TorchDataset(torch.utils.data.Dataset):
+    """ in-memory sets served item by item, batches are prefetched and pinned by the DataLoader itself (num_workers, prefetch_factor, pin_memory) """
 
     def __init__(self, *data, **options):
         
@@ -129,7 +180,8 @@ class TorchDataset(torch.utils.data.Dataset):
         if n_data == 0:
             raise ValueError("At least one set required as input")
 
-        self.data = data
+        # tensorize once, so that items are zero-copy views instead of per-item numpy->tensor conversions
+        self.data = [as_tensor(d) for d in data]
         means = options.pop('means', None)
         stds = options.pop('stds', None)
         self.transform = options.pop('transform', None)
@@ -141,10 +193,8 @@ class TorchDataset(torch.utils.data.Dataset):
         if means is not None:
             assert stds is not None, "must specify both <means> and <stds>"
 
-            self.normalize = lambda data: [(d - m) / s for d, m, s in zip(data, means, stds)]
-
-        else:
-            self.normalize = lambda data: data
+            # normalize the whole sets once, rather than every item at every epoch
+            self.data = [(d - as_tensor(m)) / as_tensor(s) for d, m, s in zip(self.data, means, stds)]
 
     def __len__(self):
 
@@ -152,7 +202,7 @@ class TorchDataset(torch.utils.data.Dataset):
 
     def __getitem__(self, idx):
 
-        data = self.normalize([s[idx] for s in self.data])
+        data = [s[idx] for s in self.data]
 
         if self.transform:
 
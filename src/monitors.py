@@ -1,32 +1,57 @@
+import json
+import time
 import torch
 
-from tensorboardX import SummaryWriter
+from torch.utils.tensorboard import SummaryWriter
 
 class MonitorTree():
 
-    def __init__(self, pruning, logdir=None):
+    def __init__(self, pruning, logdir=None, log_every=1, flush_secs=120, max_queue=1000):
 
         super(MonitorTree, self).__init__()
 
-        self.writer = SummaryWriter(logdir)
+        # events are queued and flushed to disk in the background
+        self.writer = SummaryWriter(logdir, max_queue=max_queue, flush_secs=flush_secs)
         self.pruning = pruning
+        self.log_every = log_every # per-iteration scalars (and tree statistics) are logged every <log_every> iterations only
+
+        self.scalars = {} # history of the logged scalars, exported to json on close
 
     def write(self, model, it, report_tree=False, **metrics):
 
+        if report_tree and it % self.log_every != 0:
+            return
+
         if report_tree and self.pruning:
 
-            self.writer.add_scalars('variables/d_group', 
+            d = model.latent_tree.d.detach()
+
+            # all norms in a single device->host copy
+            l0, l2 = torch.stack([(d != 0).sum().to(d.dtype), d.norm(p=2)]).tolist()
+
+            self.add_scalars('variables/d_group', 
                 { 
-                 "l0": torch.norm(model.latent_tree.d, p=0),
-                 "l2": torch.norm(model.latent_tree.d, p=2),
+                 "l0": l0,
+                 "l2": l2,
                  # "d": model.latent_tree.d,
                  }, it)
 
         for key, item in metrics.items():
-            self.writer.add_scalars(key, item, it)
+            self.add_scalars(key, item, it)
         # self.writer.add_graph(model, x)
 
+    def add_scalars(self, main_tag, scalars, it):
+
+        self.writer.add_scalars(main_tag, scalars, it)
+
+        walltime = time.time()
+        for tag, scalar in scalars.items():
+            key = "{}/{}_{}".format(self.writer.log_dir, main_tag.replace("/", "_"), tag)
+            self.scalars.setdefault(key, []).append([walltime, it, float(scalar)])
+
     def close(self, logfile="./monitor_scalars.json"):
-        self.writer.export_scalars_to_json(logfile)
-        self.writer.close()
 
+        with open(logfile, "w") as f:
+            json.dump(self.scalars, f)
+
+        self.writer.close()
@@ -19,7 +19,7 @@ def train_batch(x, y, LT_model, optimizer, criterion, nb_iter=1e4, monitor=None)
     for i in pbar:
 
         # print(LT_model.latent_tree.eta.detach().numpy())
-        optimizer.zero_grad()
+        optimizer.zero_grad(set_to_none=True)
 
         y_pred = LT_model(t_x)
 
@@ -34,13 +34,25 @@ def train_batch(x, y, LT_model, optimizer, criterion, nb_iter=1e4, monitor=None)
         if monitor:
             monitor.write(LT_model, i, report_tree=True, train={"Loss": loss.detach()})
 
-def train_stochastic(dataloader, model, optimizer, criterion, epoch, monitor=None, prog_bar=True):
+def train_stochastic(dataloader, model, optimizer, criterion, epoch, monitor=None, prog_bar=True, device=torch.device("cpu"), amp=False, log_every=10):
 
-    model.train()
+    train_stochastic_group(dataloader, [model], [optimizer], criterion, epoch, monitors=[monitor], prog_bar=prog_bar, device=device, amp=amp, log_every=log_every)
+
+def train_stochastic_group(dataloader, models, optimizers, criterion, epoch, monitors=None, prog_bar=True, device=torch.device("cpu"), amp=False, log_every=10):
+    """ train a group of independent models side by side, each batch being loaded and copied to device once for all of them """
+
+    for model in models:
+        model.train()
+
+    # bfloat16 mixed precision, only where supported
+    amp = amp and device.type == "cuda" and torch.cuda.is_bf16_supported()
+
+    if monitors is None:
+        monitors = [None] * len(models)
 
     last_iter = epoch * len(dataloader)
 
-    train_obj = 0.
+    train_objs = torch.zeros(len(models), device=device) # synced only when the progress bar is refreshed, every <log_every> iterations
 
     if prog_bar:
         pbar = tqdm(dataloader)
@@ -49,39 +61,52 @@ def train_stochastic(dataloader, model, optimizer, criterion, epoch, monitor=Non
 
     for i, batch in enumerate(pbar):
 
-        # import pdb; pdb.set_trace()
-        optimizer.zero_grad()
-
         t_x, t_y = batch
 
+        # asynchronous copies, overlapped with compute when batches are pinned
+        t_x = t_x.to(device, non_blocking=True)
+        t_y = t_y.to(device, non_blocking=True)
+
         if t_y.dim() > 2: # predictors support only flatten output atm
             t_y = t_y.view(len(t_y), -1)
 
-        y_pred = model(t_x).squeeze()
-        
-        loss = criterion(y_pred, t_y) / len(t_x)
-            
-        train_obj += loss.detach().numpy()
+        for m, (model, optimizer, monitor) in enumerate(zip(models, optimizers, monitors)):
 
-        if prog_bar:
-            pbar.set_description("avg train loss %f" % (train_obj / (i + 1)))
-        loss.backward()
+            optimizer.zero_grad(set_to_none=True)
 
-        optimizer.step()
-        
-        if monitor:
-            monitor.write(model, i + last_iter, report_tree=True, train={"Loss": loss.detach()})
-            
-def evaluate(dataloader, model, criteria, epoch=None, monitor=None):
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=amp):
+                y_pred = model(t_x).squeeze()
+
+            # loss is reduced in float32
+            loss = criterion(y_pred.float(), t_y) / len(t_x)
+
+            train_objs[m] += loss.detach()
+
+            loss.backward()
+
+            optimizer.step()
+
+            if monitor:
+                monitor.write(model, i + last_iter, report_tree=True, train={"Loss": loss.detach()})
+
+        if prog_bar and i % log_every == 0:
+            pbar.set_description("avg train losses %s" % np.array2string((train_objs / (i + 1)).cpu().numpy(), precision=4))
+
+@torch.inference_mode()
+def evaluate(dataloader, model, criteria, epoch=None, monitor=None, device=torch.device("cpu")):
 
     model.eval()
 
-    total_losses = {k: 0. for k in criteria.keys()}
+    # losses are accumulated on device, in each criterion's own dtype (exact error counts), and synced once at the end
+    total_losses = {}
     
     num_points = 0
     for batch in dataloader:
 
         t_x, t_y = batch
+
+        t_x = t_x.to(device, non_blocking=True)
+        t_y = t_y.to(device, non_blocking=True)
         
         if t_y.dim() > 2: # predictors support only flatten output atm
             t_y = t_y.view(len(t_y), -1)
@@ -91,13 +116,38 @@ def evaluate(dataloader, model, criteria, epoch=None, monitor=None):
         y_pred = model.predict(t_x).squeeze()
 
         for k in criteria.keys():
-            loss = criteria[k](y_pred, t_y)
-            total_losses[k] += loss.detach()
+            loss = criteria[k](y_pred, t_y).detach()
+            total_losses[k] = total_losses[k] + loss if k in total_losses else loss
+
+    if monitor:
+        monitor.write(model, epoch, val={k: loss / num_points for k, loss in total_losses.items()})
+
+    return {k: loss.item() / num_points for k, loss in total_losses.items()}
+
+@torch.inference_mode()
+def evaluate_full(X, y, model, criteria, epoch=None, monitor=None, device=torch.device("cpu"), batch_size=None):
+    """ same as evaluate, but on tensors instead of a DataLoader: the whole set is predicted at once, or in chunks of <batch_size> points """
+
+    model.eval()
+
+    t_x = X.to(device, non_blocking=True)
+    t_y = y.to(device, non_blocking=True)
+
+    if t_y.dim() > 2: # predictors support only flatten output atm
+        t_y = t_y.view(len(t_y), -1)
+
+    num_points = len(t_x)
+    if batch_size is None:
+        batch_size = num_points
+
+    y_pred = torch.cat([model.predict(t_x[i:i + batch_size]) for i in range(0, num_points, batch_size)]).squeeze()
+
+    total_losses = {k: criteria[k](y_pred, t_y) for k in criteria.keys()}
 
     if monitor:
         monitor.write(model, epoch, val={k: loss / num_points for k, loss in total_losses.items()})
 
-    return {k: loss.numpy() / num_points for k, loss in total_losses.items()}
+    return {k: loss.item() / num_points for k, loss in total_losses.items()}
 
 def train_ndf(dataloader, model, optimizer, epoch, jointly_training):
 
@@ -150,7 +200,7 @@ def train_ndf(dataloader, model, optimizer, epoch, jointly_training):
 
     for data, target in tqdm(dataloader):
 
-        optimizer.zero_grad()
+        optimizer.zero_grad(set_to_none=True)
 
         output = model(data)
         
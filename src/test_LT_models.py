@@ -0,0 +1,16 @@
+import torch
+
+from .LT_models import LTBinaryClassifier
+
+
+def test_init_bias_float32_under_autocast():
+    """Bias initialized on a bfloat16 autocast forward stays a float32 parameter"""
+    torch.manual_seed(42)
+    model = LTBinaryClassifier(3, 10)
+
+    with torch.autocast("cpu", dtype=torch.bfloat16):
+        model(torch.randn(32, 10))
+
+    bias = model.latent_tree.bias
+    assert isinstance(bias, torch.nn.Parameter)
+    assert bias.dtype == torch.float32
@@ -82,6 +82,18 @@ class BinarySearchTree():
 
         return n1
 
+    def leaves_LCA(self):
+        """ Lowest Common Ancestors between all pairs of leaves, as a (nb_leaves, nb_leaves) matrix """
+
+        n1 = np.arange(self.nb_split, self.nb_nodes)[:, None]
+        n2 = n1.T
+
+        # all leaves lie at the same depth: climb both sides together until they meet
+        for _ in range(self.depth):
+            n1, n2 = np.where(n1 != n2, (n1 - 1) // 2, n1), np.where(n1 != n2, (n2 - 1) // 2, n2)
+
+        return n1
+
     def get_nodes_level(self, z, depth=0):
 
         leaves = np.argmax(z[:, self.leaves], 1) + self.nb_split
@@ -143,4 +155,7 @@ if __name__ == "__main__":
     assert bst.find_LCA(5, 6) == 2, bst.find_LCA(5, 6)
     assert bst.find_LCA(0, 6) == 0, bst.find_LCA(0, 6)
     assert bst.find_LCA(1, 6) == 0, bst.find_LCA(1, 6)
-    assert bst.find_LCA(25, 27) == 2, bst.find_LCA(25, 27)
\ No newline at end of file
+    assert bst.find_LCA(25, 27) == 2, bst.find_LCA(25, 27)
+
+    lca = bst.leaves_LCA()
+    assert all(lca[n1 - bst.nb_split, n2 - bst.nb_split] == bst.find_LCA(n1, n2) for n1 in bst.leaves for n2 in bst.leaves)
\ No newline at end of file
@@ -3,16 +3,18 @@ import numpy as np
 import random
 import requests
 import os
+import warnings
 
 import torch
 from tqdm import tqdm
 
-def deterministic(random_state):
+def deterministic(random_state, cudnn_benchmark=False):
+    """ seed all random generators, <cudnn_benchmark> lets cuDNN autotune its kernels at the cost of bit-exact reproducibility """
     np.random.seed(random_state)
     torch.manual_seed(random_state)
     random.seed(random_state)
-    torch.backends.cudnn.deterministic = True
-    torch.backends.cudnn.benchmark = False
+    torch.backends.cudnn.deterministic = not cudnn_benchmark
+    torch.backends.cudnn.benchmark = cudnn_benchmark
 
 def get_device():
 
@@ -26,6 +28,22 @@ def get_device():
 
     return pin_memory, device
 
+def compile_model(model, device):
+    """ fuse the model's small ops into few kernels with torch.compile (PyTorch>=2.0, GPU only) """
+    if device.type == "cuda" and hasattr(torch, "compile"):
+        return torch.compile(model, backend="inductor", mode="reduce-overhead")
+
+    return model
+
+def check_num_workers(num_workers):
+    """ warn if more DataLoader workers are requested than there are cpus """
+    num_cpus = os.cpu_count() or 1
+
+    if num_workers > num_cpus:
+        warnings.warn("{} DataLoader workers requested but only {} cpus are available".format(num_workers, num_cpus))
+
+    return num_workers
+
 """
 Code adapted from https://github.com/Qwicen/node/blob/master/lib/data.py .
 
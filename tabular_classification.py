@@ -9,9 +9,9 @@ from qhoptim.pyt import QHAdam
 
 from src.LT_models import LTBinaryClassifier
 from src.monitors import MonitorTree
-from src.optimization import train_stochastic, evaluate
-from src.datasets import Dataset, TorchDataset
-from src.utils import deterministic
+from src.optimization import train_stochastic_group, evaluate_full
+from src.datasets import Dataset, TorchDataset, as_tensor
+from src.utils import check_num_workers, compile_model, deterministic, get_device
 
 import time
 import sys
@@ -25,37 +25,45 @@ DROPOUT = float(sys.argv[5])
 LR = 0.001
 BATCH_SIZE = 512 
 EPOCHS = 100
+NUM_WORKERS = check_num_workers(16)
+LOG_EVERY = 10 # per-iteration scalars and tree statistics are logged every LOG_EVERY iterations
 
 pruning = REG > 0
 
-data = Dataset(DATA_NAME, normalize=True, seed=459107)
+pin_memory, device = get_device()
+
+# evaluation criterion => error rate
+def eval_criterion(x, y):
+    return x.long().ne(y.long()).sum()
+
+data = Dataset(DATA_NAME, normalize=True, seed=459107, cache=True)
 print('classes', np.unique(data.y_test))
 
-test_losses, train_times, test_times = [], [], []
+trainloader = DataLoader(TorchDataset(data.X_train, data.y_train), batch_size=BATCH_SIZE, num_workers=NUM_WORKERS, shuffle=True, pin_memory=pin_memory, persistent_workers=NUM_WORKERS > 0, prefetch_factor=4)
+
+# validation and test sets are evaluated in large chunks directly on device
+X_valid, y_valid = as_tensor(data.X_valid).to(device), as_tensor(data.y_valid).to(device)
+X_test, y_test = as_tensor(data.X_test).to(device), as_tensor(data.y_test).to(device)
+
+# init loss
+loss = BCELoss(reduction="sum")
+criterion = lambda x, y: loss(x.float(), y.float())
+
+runs = []
 for SEED in [1225, 1337, 2020, 6021991]:
-    deterministic(SEED)
+    deterministic(SEED, cudnn_benchmark=True)
 
     save_dir = Path("./results/tabular-quantile/") / DATA_NAME / "depth={}/reg={}/mlp-layers={}/dropout={}/seed={}".format(TREE_DEPTH, REG, MLP_LAYERS, DROPOUT, SEED)
     save_dir.mkdir(parents=True, exist_ok=True)
 
-    trainloader = DataLoader(TorchDataset(data.X_train, data.y_train), batch_size=BATCH_SIZE, num_workers=16, shuffle=True)
-    valloader = DataLoader(TorchDataset(data.X_valid, data.y_valid), batch_size=BATCH_SIZE*2, num_workers=16, shuffle=False)
-    testloader = DataLoader(TorchDataset(data.X_test, data.y_test), batch_size=BATCH_SIZE*2, num_workers=16, shuffle=False)
-
-    model = LTBinaryClassifier(TREE_DEPTH, data.X_train.shape[1], reg=REG)
+    model = LTBinaryClassifier(TREE_DEPTH, data.X_train.shape[1], reg=REG).to(device)
+    model = compile_model(model, device)
 
     # init optimizer
     optimizer = QHAdam(model.parameters(), lr=LR, nus=(0.7, 1.0), betas=(0.995, 0.998))
 
-    # init loss
-    loss = BCELoss(reduction="sum")
-    criterion = lambda x, y: loss(x.float(), y.float())
-
-    # evaluation criterion => error rate
-    eval_criterion = lambda x, y: (x != y).sum()
-
     # init train-eval monitoring 
-    monitor = MonitorTree(pruning, save_dir)
+    monitor = MonitorTree(pruning, save_dir, log_every=LOG_EVERY)
 
     state = {
         'batch-size': BATCH_SIZE,
@@ -66,39 +74,58 @@ for SEED in [1225, 1337, 2020, 6021991]:
         'reg': REG,
     }
 
-    best_val_loss = float("inf")
-    best_e = -1
-    no_improv = 0
-    t0 = time.time()
-    for e in range(EPOCHS):
-        train_stochastic(trainloader, model, optimizer, criterion, epoch=e, monitor=monitor)
-
-        val_loss = evaluate(valloader, model, {'ER': eval_criterion}, epoch=e, monitor=monitor)
-        print("Epoch %i: validation loss = %f\n" % (e, val_loss["ER"]))
-        no_improv += 1
-
-        if val_loss["ER"] < best_val_loss:
-            best_val_loss = val_loss["ER"]
-            best_e = e
-            no_improv = 0
-            LTBinaryClassifier.save_model(model, optimizer, state, save_dir, epoch=e, val_er=best_val_loss)
-
-        if no_improv == EPOCHS // 5:
-            break
-    t1 = time.time()
-    monitor.close()
-    print("best validation error rate (epoch {}): {}\n".format(best_e, best_val_loss))
-
-    model = LTBinaryClassifier.load_model(save_dir)
+    runs.append({
+        'seed': SEED,
+        'save_dir': save_dir,
+        'model': model,
+        'optimizer': optimizer,
+        'monitor': monitor,
+        'state': state,
+        'best_val_loss': float("inf"),
+        'best_e': -1,
+        'no_improv': 0,
+    })
+
+# the models of all seeds are trained side by side, sharing every training batch
+training = list(runs)
+t0 = time.time()
+for e in range(EPOCHS):
+    train_stochastic_group(trainloader, [r['model'] for r in training], [r['optimizer'] for r in training], criterion, epoch=e, monitors=[r['monitor'] for r in training], device=device, amp=True, log_every=LOG_EVERY)
+
+    for run in list(training):
+        model, optimizer = run['model'], run['optimizer']
+
+        val_loss = evaluate_full(X_valid, y_valid, model, {'ER': eval_criterion}, epoch=e, monitor=run['monitor'], device=device, batch_size=BATCH_SIZE*32)
+        print("Seed %i, epoch %i: validation loss = %f\n" % (run['seed'], e, val_loss["ER"]))
+        run['no_improv'] += 1
+
+        if val_loss["ER"] < run['best_val_loss']:
+            run['best_val_loss'] = val_loss["ER"]
+            run['best_e'] = e
+            run['no_improv'] = 0
+            LTBinaryClassifier.save_model(model, optimizer, run['state'], run['save_dir'], epoch=e, val_er=run['best_val_loss'])
+
+        if run['no_improv'] == EPOCHS // 5:
+            training.remove(run)
+
+    if not training:
+        break
+t1 = time.time()
+
+test_losses, test_times = [], []
+for run in runs:
+    run['monitor'].close()
+    print("seed {}: best validation error rate (epoch {}): {}\n".format(run['seed'], run['best_e'], run['best_val_loss']))
+
+    model = LTBinaryClassifier.load_model(run['save_dir']).to(device)
     t2 = time.time()
-    test_loss = evaluate(testloader, model, {'ER': eval_criterion})
-    print("test error rate (model of epoch {}): {}\n".format(best_e, test_loss['ER']))
+    test_loss = evaluate_full(X_test, y_test, model, {'ER': eval_criterion}, device=device, batch_size=BATCH_SIZE*32)
+    print("test error rate (model of epoch {}): {}\n".format(run['best_e'], test_loss['ER']))
     t3 = time.time()
     test_losses.append(test_loss['ER'])
-    train_times.append(t1 - t0)
     test_times.append(t3 - t2)
 
 print(np.mean(test_losses), np.std(test_losses))
-np.save(save_dir / '../test-losses.npy', test_losses)
-print("Avg train time", np.mean(train_times))
+np.save(runs[-1]['save_dir'] / '../test-losses.npy', test_losses)
+print("Train time (all seeds)", t1 - t0)
 print("Avg test time", np.mean(test_times))
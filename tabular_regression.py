@@ -11,9 +11,9 @@ from qhoptim.pyt import QHAdam
 
 from src.LT_models import LTRegressor
 from src.monitors import MonitorTree
-from src.optimization import train_stochastic, evaluate
-from src.datasets import Dataset, TorchDataset
-from src.utils import deterministic
+from src.optimization import train_stochastic, evaluate_full
+from src.datasets import Dataset, TorchDataset, as_tensor
+from src.utils import check_num_workers, compile_model, deterministic, get_device
 
 import sys
 
@@ -27,17 +27,23 @@ DROPOUT = float(sys.argv[5])
 LR = 0.001
 BATCH_SIZE = 512 
 EPOCHS = 100
+NUM_WORKERS = check_num_workers(16)
+LOG_EVERY = 10 # per-iteration scalars and tree statistics are logged every LOG_EVERY iterations
 
 pruning = REG > 0
 
-data = Dataset(DATA_NAME, normalize=True, normalize_target=True)
+pin_memory, device = get_device()
+
+data = Dataset(DATA_NAME, normalize=True, normalize_target=True, cache=True)
 in_features = data.X_train.shape[1]
 out_features = 1
 print("target mean = %.5f, std = %.5f" % (data.mean_y, data.std_y))
 
-trainloader = DataLoader(TorchDataset(data.X_train, data.y_train), batch_size=BATCH_SIZE, num_workers=16, shuffle=True)
-valloader = DataLoader(TorchDataset(data.X_valid, data.y_valid), batch_size=BATCH_SIZE*2, num_workers=16, shuffle=False)
-testloader = DataLoader(TorchDataset(data.X_test, data.y_test), batch_size=BATCH_SIZE*2, num_workers=16, shuffle=False)
+trainloader = DataLoader(TorchDataset(data.X_train, data.y_train), batch_size=BATCH_SIZE, num_workers=NUM_WORKERS, shuffle=True, pin_memory=pin_memory, persistent_workers=NUM_WORKERS > 0, prefetch_factor=4)
+
+# validation and test sets are evaluated in large chunks directly on device
+X_valid, y_valid = as_tensor(data.X_valid).to(device), as_tensor(data.y_valid).to(device)
+X_test, y_test = as_tensor(data.X_test).to(device), as_tensor(data.y_test).to(device)
 
 test_losses, train_time, test_time = [], [], []
 
@@ -45,9 +51,10 @@ for SEED in [1225, 1337, 2020, 6021991]:
     save_dir = Path("./results/tabular/") / DATA_NAME / "depth={}/reg={}/mlp-layers={}/dropout={}/seed={}".format(TREE_DEPTH, REG, MLP_LAYERS, DROPOUT, SEED)
     save_dir.mkdir(parents=True, exist_ok=True)
 
-    deterministic(SEED)
+    deterministic(SEED, cudnn_benchmark=True)
 
-    model = LTRegressor(TREE_DEPTH, in_features, out_features, reg=REG, linear=LINEAR, layers=MLP_LAYERS, dropout=DROPOUT)
+    model = LTRegressor(TREE_DEPTH, in_features, out_features, reg=REG, linear=LINEAR, layers=MLP_LAYERS, dropout=DROPOUT).to(device)
+    model = compile_model(model, device)
 
     # init optimizer
     optimizer = QHAdam(model.parameters(), lr=LR, nus=(0.7, 1.0), betas=(0.995, 0.998))
@@ -60,7 +67,7 @@ for SEED in [1225, 1337, 2020, 6021991]:
     lr_scheduler = ReduceLROnPlateau(optimizer, 'min', factor=0.1, patience=2)
 
     # init train-eval monitoring 
-    monitor = MonitorTree(pruning, save_dir)
+    monitor = MonitorTree(pruning, save_dir, log_every=LOG_EVERY)
 
     state = {
         'batch-size': BATCH_SIZE,
@@ -75,9 +82,9 @@ for SEED in [1225, 1337, 2020, 6021991]:
     no_improv = 0
     t0 = time.time()
     for e in range(EPOCHS):
-        train_stochastic(trainloader, model, optimizer, criterion, epoch=e, monitor=monitor)
+        train_stochastic(trainloader, model, optimizer, criterion, epoch=e, monitor=monitor, device=device, amp=True, log_every=LOG_EVERY)
 
-        val_loss = evaluate(valloader, model, {'valid_MSE': criterion}, epoch=e, monitor=monitor)
+        val_loss = evaluate_full(X_valid, y_valid, model, {'valid_MSE': criterion}, epoch=e, monitor=monitor, device=device, batch_size=BATCH_SIZE*32)
         print(f"Epoch {e}: {val_loss}\n")
         
         no_improv += 1
@@ -98,9 +105,9 @@ for SEED in [1225, 1337, 2020, 6021991]:
     monitor.close()
     print("best validation loss (epoch {}): {}\n".format(best_e, best_val_loss * data.std_y ** 2))
 
-    model = LTRegressor.load_model(save_dir)
+    model = LTRegressor.load_model(save_dir).to(device)
     t2 = time.time()
-    test_loss = evaluate(testloader, model, {'test_MSE': criterion})
+    test_loss = evaluate_full(X_test, y_test, model, {'test_MSE': criterion}, device=device, batch_size=BATCH_SIZE*32)
     print("test loss (model of epoch {}): {}\n".format(best_e, test_loss['test_MSE'] * data.std_y ** 2))
     t3 = time.time()
     test_losses.append(test_loss['test_MSE'] * data.std_y ** 2)
@@ -1,4 +1,5 @@
 import numpy as np
+import os
 
 from pathlib import Path
 
@@ -12,28 +13,40 @@ from qhoptim.pyt import QHAdam
 
 from src.LT_models import LTBinaryClassifier
 from src.monitors import MonitorTree
-from src.optimization import train_stochastic, evaluate
-from src.datasets import Dataset, TorchDataset
-from src.utils import deterministic
+from src.optimization import train_stochastic_group, evaluate_full
+from src.datasets import Dataset, TorchDataset, as_tensor
+from src.utils import deterministic, get_device
 
 SEED = 1225
 DATA_NAME = "HIGGS"
 LR = 0.001
 BATCH_SIZE = 512 
 EPOCHS = 100
+NUM_WORKERS = min(8, os.cpu_count() or 1)
 LINEAR = False
+N_TRIALS = 100
+GROUP_SIZE = 4 # number of trials trained at once
+LOG_EVERY = 100 # per-iteration traces are not used by the search, log them sparsely
 
-data = Dataset(DATA_NAME, normalize=True, quantile_transform=True, seed=459107)
+pin_memory, device = get_device()
+
+data = Dataset(DATA_NAME, normalize=True, quantile_transform=True, seed=459107, cache=True)
 print('classes', np.unique(data.y_test))
 
-trainloader = DataLoader(TorchDataset(data.X_train, data.y_train), batch_size=BATCH_SIZE, num_workers=12, shuffle=True)
-valloader = DataLoader(TorchDataset(data.X_valid, data.y_valid), batch_size=BATCH_SIZE*2, num_workers=12, shuffle=False)
+trainloader = DataLoader(TorchDataset(data.X_train, data.y_train), batch_size=BATCH_SIZE, num_workers=NUM_WORKERS, shuffle=True, pin_memory=pin_memory, persistent_workers=NUM_WORKERS > 0, prefetch_factor=4)
+
+# validation set is evaluated in large chunks directly on device
+X_valid, y_valid = as_tensor(data.X_valid).to(device), as_tensor(data.y_valid).to(device)
 
 root_dir = Path("./results/optuna/tabular/") / "{}/linear={}/".format(DATA_NAME, LINEAR)
 
 deterministic(SEED)
 
-def objective(trial):
+# evaluation criterion => error rate
+def eval_criterion(x, y):
+    return x.long().ne(y.long()).sum()
+
+def init_trial(trial):
 
     TREE_DEPTH = trial.suggest_int('TREE_DEPTH', 2, 6)
     REG = trial.suggest_loguniform('REG', 1e-3, 1e3)
@@ -55,6 +68,8 @@ def objective(trial):
         model = LTBinaryClassifier(TREE_DEPTH, data.X_train.shape[1], reg=REG, linear=LINEAR, layers=MLP_LAYERS, dropout=DROPOUT)
 
     print(model.count_parameters(), "model's parameters")
+    # not compiled: every trial samples a new architecture, which would exhaust torch.compile's recompile limit within a few trials
+    model = model.to(device)
     
     save_dir.mkdir(parents=True, exist_ok=True)
 
@@ -64,14 +79,8 @@ def objective(trial):
     # init learning rate scheduler
     lr_scheduler = ReduceLROnPlateau(optimizer, 'min', factor=0.1, patience=2)
 
-    # init loss
-    criterion = BCELoss(reduction="sum")
-
-    # evaluation criterion => error rate
-    eval_criterion = lambda x, y: (x.long() != y.long()).sum()
-
     # init train-eval monitoring 
-    monitor = MonitorTree(pruning, save_dir)
+    monitor = MonitorTree(pruning, save_dir, log_every=LOG_EVERY)
 
     state = {
         'batch-size': BATCH_SIZE,
@@ -81,44 +90,77 @@ def objective(trial):
         'dataset': DATA_NAME,
     }
 
-    best_val_loss = float("inf")
-    best_e = -1
-    no_improv = 0
+    return {
+        'trial': trial,
+        'state': state,
+        'model': model,
+        'optimizer': optimizer,
+        'lr_scheduler': lr_scheduler,
+        'monitor': monitor,
+        'best_val_loss': float("inf"),
+        'best_e': -1,
+        'no_improv': 0,
+    }
+
+def optimize_group(study, trials):
+    """ train the models of several trials side by side, sharing every training batch """
+
+    runs = [init_trial(trial) for trial in trials]
+
+    # init loss
+    criterion = BCELoss(reduction="sum")
+
     for e in range(EPOCHS):
-        train_stochastic(trainloader, model, optimizer, criterion, epoch=e, monitor=monitor)
-
-        val_loss = evaluate(valloader, model, {'ER': eval_criterion}, epoch=e, monitor=monitor)
-        
-        no_improv += 1
-        if val_loss['ER'] < best_val_loss:
-            best_val_loss = val_loss['ER']
-            best_e = e
-            no_improv = 0
-            # save_model(model, optimizer, state, save_dir)
-        
-        # reduce learning rate if needed
-        lr_scheduler.step(val_loss['ER'])
-        monitor.write(model, e, train={"lr": optimizer.param_groups[0]['lr']})
-
-        trial.report(val_loss['ER'], e)
-        # Handle pruning based on the intermediate value.
-        if trial.should_prune() or np.isnan(val_loss['ER']):
-            monitor.close()
-            raise optuna.TrialPruned()
-
-        if no_improv == 10:
+        train_stochastic_group(trainloader, [r['model'] for r in runs], [r['optimizer'] for r in runs], criterion, epoch=e, monitors=[r['monitor'] for r in runs], device=device, amp=True, log_every=LOG_EVERY)
+
+        for run in list(runs):
+            model, optimizer, monitor, trial = run['model'], run['optimizer'], run['monitor'], run['trial']
+
+            val_loss = evaluate_full(X_valid, y_valid, model, {'ER': eval_criterion}, epoch=e, monitor=monitor, device=device, batch_size=BATCH_SIZE*32)
+            
+            run['no_improv'] += 1
+            if val_loss['ER'] < run['best_val_loss']:
+                run['best_val_loss'] = val_loss['ER']
+                run['best_e'] = e
+                run['no_improv'] = 0
+                # save_model(model, optimizer, run['state'], save_dir)
+            
+            # reduce learning rate if needed
+            run['lr_scheduler'].step(val_loss['ER'])
+            monitor.write(model, e, train={"lr": optimizer.param_groups[0]['lr']})
+
+            trial.report(val_loss['ER'], e)
+            # Handle pruning based on the intermediate value.
+            if trial.should_prune() or np.isnan(val_loss['ER']):
+                monitor.close()
+                study.tell(trial, state=optuna.trial.TrialState.PRUNED)
+                runs.remove(run)
+
+            elif run['no_improv'] == 10:
+                finish_trial(study, run)
+                runs.remove(run)
+
+        if not runs:
             break
 
-    print("Best validation ER:", best_val_loss)
-    monitor.close()
+    for run in runs:
+        finish_trial(study, run)
+
+def finish_trial(study, run):
 
-    return best_val_loss
+    print("Best validation ER:", run['best_val_loss'])
+    run['monitor'].close()
+
+    study.tell(run['trial'], run['best_val_loss'])
 
 if __name__ == "__main__":
 
     # Set up the median stopping rule as the pruning condition.
     study = optuna.create_study(study_name=DATA_NAME, pruner=optuna.pruners.MedianPruner())
-    study.optimize(objective, n_trials=100)
+
+    # trials are asked by groups, whose models are trained together
+    for _ in range(N_TRIALS // GROUP_SIZE):
+        optimize_group(study, [study.ask() for _ in range(GROUP_SIZE)])
 
     print(study.best_params, study.best_value)
     df = study.trials_dataframe(attrs=('number', 'value', 'params', 'state'))